@@ -1,35 +1,78 @@
 # ========== [ PART 1: IMPORTS AND CONFIGURATION ] ==========
+import asyncio
 import logging
-import threading
 import time
-import requests
+import aiohttp
 import base64
+import ijson
+import itertools
 import json
 import os
+import orjson
+import sqlite3
 from telegram import Update
-from telegram.ext import Updater, CommandHandler, CallbackContext
-from solana.rpc.api import Client
+from telegram.ext import AIORateLimiter, ApplicationBuilder, CommandHandler, ContextTypes
+from solana.rpc.async_api import AsyncClient
 from solana.rpc.commitment import Confirmed
 from solana.publickey import PublicKey
 from solana.transaction import Transaction
 from solana.keypair import Keypair
 from solana.system_program import TransferParams, transfer
-from solana.rpc.types import TxOpts
+from solana.rpc.types import TokenAccountOpts, TxOpts
+from solana.rpc.websocket_api import connect
+from solders.transaction_status import TransactionConfirmationStatus
 from mnemonic import Mnemonic
+from cachetools import TTLCache
+from wallet_store import get_keypair, get_phrase, open_store, put_keypair
 
 # Configuration
 API_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", ":-")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST")  # Public hostname; polling is used if unset
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = "telegram"  # Fixed URL path, deliberately not the bot token
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Required in webhook mode; checked on every update
+WEBHOOK_CERT = os.getenv("WEBHOOK_CERT")  # TLS cert/key paths; without them the server is plain
+WEBHOOK_KEY = os.getenv("WEBHOOK_KEY")    # HTTP and must sit behind a TLS-terminating proxy
 DEV_WALLET = PublicKey("")
 JUPITER_API = "https://price.jup.ag/v4/price"
 RAYDIUM_API = "https://api.raydium.io/v2/main/pairs"
+JUPITER_QUOTE_API = "https://quote-api.jup.ag/v6/quote"
+JUPITER_SWAP_API = "https://quote-api.jup.ag/v6/swap"
+SWAP_SLIPPAGE_BPS = 50  # 0.5% max slippage
+SWAP_PAYLOAD_DEFAULTS = {"wrapUnwrapSOL": True}  # Fixed fields of every swap request
+JSON_HEADERS = {"Content-Type": "application/json"}
 SOLANA_RPC = "https://api.mainnet-beta.solana.com"
+SOLANA_WS = "wss://api.mainnet-beta.solana.com"
 TOKEN_MINT = PublicKey("YOUR_TOKEN_MINT_ADDRESS")  # REPLACE WITH ACTUAL TOKEN ADDRESS
+TOKEN_MINT_STR = str(TOKEN_MINT)
+SOL_MINT = "So11111111111111111111111111111111111111112"  # Wrapped SOL mint
 TOKEN_DECIMALS = 6  # ADJUST BASED ON YOUR TOKEN
 SOLANA_FEE_RATE = 0.000005  # Network fee
 DEV_FEE_RATE = 0.01  # 1% dev fee
+PRICE_CACHE_TTL = 60  # Seconds before a cached token price is refetched
+BALANCE_CACHE_TTL = 10  # Seconds before a cached token balance is re-read on-chain
+RAYDIUM_INDEX_TTL = 60  # Seconds before the Raydium pairs index is rebuilt
+RAYDIUM_RETRY_DELAY = 30  # Seconds to keep a stale index after a failed rebuild
+PRICE_REFRESH_INTERVAL = 30  # Seconds between background price refreshes
+HEARTBEAT_INTERVAL = 300  # Seconds between heartbeat log lines
+HTTP_RETRIES = 3  # Retries for transient HTTP failures
+HTTP_RETRY_BACKOFF = 0.2  # Base backoff in seconds, doubled per retry
+HTTP_RETRY_STATUSES = {502, 503, 504}
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=12, connect=3)  # Per HTTP attempt
+HTTP_CALL_TIMEOUT = 15  # Hard cap in seconds on a call including retries
+RAYDIUM_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=3)  # Multi-MB pairs download
+RPC_TIMEOUT = 10  # Seconds per Solana RPC request
+CONCURRENT_UPDATES = 32  # Updates processed in parallel by the bot
+BOT_MAX_MESSAGE_RATE = 28  # Outgoing messages per second (Telegram caps at 30)
+BOT_FLOOD_RETRIES = 3  # Retries after a Telegram 429 RetryAfter
+CONFIRM_TIMEOUT = 60  # Seconds to wait for a transaction to be confirmed
+
+# Loaded once: Mnemonic() reads and parses the wordlist from disk
+MNEMO = Mnemonic("english")
 
 # Initialize Solana client
-client = Client(SOLANA_RPC)
+client = AsyncClient(SOLANA_RPC, timeout=RPC_TIMEOUT)
+http_session = None  # Shared aiohttp.ClientSession, opened in main()
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -39,153 +82,368 @@ logger = logging.getLogger(__name__)
 # ========== [ PART 2: GLOBAL DATA STORAGE ] ==========
 ADMIN_IDS = [0]  # Replace with actual admin Telegram IDs
 
-user_wallets = {}      # Stores Keypair objects: {user_id: Keypair}
-user_phrases = {}      # Stores mnemonic phrases: {user_id: phrase}
+# User wallets and mnemonic phrases are persisted in wallet_store (SQLite)
 copy_following = {}    # Copy trading system: {follower_id: leader_username}
 trader_ranking = {}    # Trader ranking: {user_id: score}
-token_prices = {}      # Token price cache: {token_mint: price}
+token_prices = TTLCache(maxsize=2048, ttl=PRICE_CACHE_TTL)  # Token price cache: {token_mint: price}
+tracked_mints = {TOKEN_MINT_STR}  # Mints kept warm by housekeeping
+inflight = {}          # In-flight fetches shared by concurrent callers: {key: asyncio.Task}
+token_balances = TTLCache(maxsize=10_000, ttl=BALANCE_CACHE_TTL)  # {(wallet, token_mint): balance}
+balance_generations = TTLCache(maxsize=10_000, ttl=60)  # Set on invalidation: {(wallet, token_mint): int}
+generation_counter = itertools.count(1)  # Never repeats, so expired generations can't recur
+raydium_index = (0.0, {})  # Raydium prices: (built_at, {base_mint: price})
+raydium_lock = asyncio.Lock()
 
 # ========== [ PART 3: SOLANA BLOCKCHAIN FUNCTIONS ] ==========
 
-def create_solana_wallet():
+async def request_json(method, url, **kwargs):
+    """Sends a request on the shared HTTP session and returns the JSON body"""
+    for attempt in range(HTTP_RETRIES + 1):
+        try:
+            async with http_session.request(method, url, **kwargs) as resp:
+                # Gateway error sementara: ulangi dengan backoff
+                if resp.status not in HTTP_RETRY_STATUSES or attempt == HTTP_RETRIES:
+                    resp.raise_for_status()
+                    return orjson.loads(await resp.read())
+        except aiohttp.ClientConnectionError:
+            if attempt == HTTP_RETRIES:
+                raise
+        await asyncio.sleep(HTTP_RETRY_BACKOFF * 2 ** attempt)
+
+async def create_solana_wallet():
     """Creates a new Solana wallet with mnemonic"""
-    mnemo = Mnemonic("english")
-    phrase = mnemo.generate(strength=128)
-    seed = mnemo.to_seed(phrase)[:32]
+    phrase = MNEMO.generate(strength=128)
+    # PBKDF2 (2048 iterasi) jalan di thread agar event loop tidak tertahan
+    seed = (await asyncio.to_thread(MNEMO.to_seed, phrase))[:32]
     keypair = Keypair.from_seed(seed)
     return keypair, phrase
 
-def get_sol_balance(public_key):
+async def get_sol_balance(public_key: PublicKey):
     """Gets SOL balance from blockchain"""
     try:
-        balance = client.get_balance(PublicKey(public_key), commitment=Confirmed).value
+        balance = (await client.get_balance(public_key, commitment=Confirmed)).value
         return balance / 10**9  # Convert lamports to SOL
     except Exception as e:
         logger.error(f"SOL balance error: {e}")
         return 0.0
 
-def get_token_balance(public_key, token_mint):
+async def single_flight(key, fetch):
+    """Runs fetch() once per key; concurrent callers await the same result"""
+    task = inflight.get(key)
+    if task is None:
+        task = asyncio.create_task(fetch())
+        inflight[key] = task
+
+        def forget(done):
+            # Hapus hanya jika belum diganti (invalidate bisa memulai fetch baru)
+            if inflight.get(key) is done:
+                del inflight[key]
+
+        task.add_done_callback(forget)
+    # Shield agar pembatalan satu caller tidak membatalkan fetch bersama
+    return await asyncio.shield(task)
+
+async def get_token_balance(public_key: PublicKey, token_mint: PublicKey):
+    """Gets token balance, cached and shared between concurrent callers"""
+    cached = token_balances.get((public_key, token_mint))
+    if cached is not None:
+        return cached
+    return await single_flight(
+        ("balance", public_key, token_mint),
+        lambda: fetch_token_balance(public_key, token_mint)
+    )
+
+async def fetch_token_balance(public_key: PublicKey, token_mint: PublicKey):
     """Gets token balance without spl.token"""
+    cache_key = (public_key, token_mint)
+    generation = balance_generations.get(cache_key, 0)
     try:
         # Ambil semua token account user untuk mint tertentu
-        resp = client.get_token_accounts_by_owner(
-            PublicKey(public_key),
-            {"mint": str(token_mint)},
+        resp = await client.get_token_accounts_by_owner(
+            public_key,
+            TokenAccountOpts(mint=token_mint),
             commitment=Confirmed
         )
         accounts = resp["result"]["value"]
         if not accounts:
+            store_token_balance(cache_key, generation, 0.0)
             return 0.0
 
         # Ambil saldo dari token account pertama
         token_account = accounts[0]["pubkey"]
-        balance_resp = client.get_token_account_balance(PublicKey(token_account))
+        balance_resp = await client.get_token_account_balance(PublicKey(token_account))
         amount = float(balance_resp["result"]["value"]["amount"])
-        return amount / 10**TOKEN_DECIMALS
+        token_balance = amount / 10**TOKEN_DECIMALS
+        store_token_balance(cache_key, generation, token_balance)
+        return token_balance
     except Exception as e:
         logger.error(f"Token balance error: {e}")
         return 0.0
         
-def get_token_price(token_mint):
+def store_token_balance(cache_key, generation, token_balance):
+    """Caches a fetched balance unless it was invalidated while in flight"""
+    if balance_generations.get(cache_key, 0) == generation:
+        token_balances[cache_key] = token_balance
+
+def invalidate_token_balance(public_key: PublicKey, token_mint: PublicKey):
+    """Drops a cached token balance so the next read goes on-chain"""
+    cache_key = (public_key, token_mint)
+    token_balances.pop(cache_key, None)
+    balance_generations[cache_key] = next(generation_counter)
+    # Fetch yang sedang berjalan mungkin membaca state sebelum swap
+    inflight.pop(("balance",) + cache_key, None)
+
+class PriceBatcher:
+    """Coalesces concurrent Jupiter price lookups into batched requests"""
+
+    def __init__(self, delay=0.02, max_batch=100):
+        self.delay = delay            # Debounce window in seconds
+        self.max_batch = max_batch    # Max mints per Jupiter request
+        self.pending = {}             # {token_mint: asyncio.Future}
+        self.flush_task = None
+
+    async def get(self, mint_str):
+        """Waits for the mint's price from the next batch (None if not listed)"""
+        future = self.pending.get(mint_str)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[mint_str] = future
+            if self.flush_task is None:
+                self.flush_task = asyncio.create_task(self.flush())
+        # Shield agar pembatalan satu caller tidak membatalkan caller lain
+        return await asyncio.shield(future)
+
+    async def flush(self):
+        """Drains pending mints after the debounce window"""
+        await asyncio.sleep(self.delay)
+        pending, self.pending = self.pending, {}
+        self.flush_task = None
+
+        prices = await self.fetch_many(list(pending))
+        for mint_str, future in pending.items():
+            if not future.done():
+                future.set_result(prices.get(mint_str))
+
+    async def fetch_many(self, mints):
+        """Fetches prices for any number of mints, max_batch per request"""
+        chunks = [mints[i:i + self.max_batch] for i in range(0, len(mints), self.max_batch)]
+        results = await asyncio.gather(*(self.fetch(chunk) for chunk in chunks))
+
+        prices = {}
+        for result in results:
+            prices.update(result)
+        return prices
+
+    async def fetch(self, mints):
+        """Fetches prices for a list of mints in one Jupiter request"""
+        try:
+            # Endpoint: /v4/price?ids=<mint1>,<mint2>,...
+            data = (await asyncio.wait_for(
+                request_json("GET", f"{JUPITER_API}?ids={','.join(mints)}"),
+                HTTP_CALL_TIMEOUT
+            )).get("data") or {}
+            # Struktur: {"data": { "<mint>": { "price": … } }}
+            return {
+                mint_str: float(info["price"])
+                for mint_str, info in data.items()
+                if info and "price" in info
+            }
+        except Exception as e:
+            logger.error(f"Jupiter batch price error: {e}")
+        return {}
+
+price_batcher = PriceBatcher()
+
+async def get_raydium_index():
+    """Returns Raydium prices as {base_mint: price}, rebuilt every RAYDIUM_INDEX_TTL"""
+    global raydium_index
+
+    built_at, index = raydium_index
+    if time.monotonic() - built_at <= RAYDIUM_INDEX_TTL:
+        return index
+
+    async with raydium_lock:
+        built_at, index = raydium_index
+        if time.monotonic() - built_at > RAYDIUM_INDEX_TTL:
+            try:
+                # Endpoint: /v2/main/pairs (daftar semua pair, beberapa MB)
+                # Di-parse secara streaming agar list penuh tidak pernah dimuat ke memori
+                async with http_session.get(RAYDIUM_API, timeout=RAYDIUM_TIMEOUT) as resp:
+                    resp.raise_for_status()
+                    index = {
+                        pair["baseMint"]: float(pair["price"])
+                        async for pair in ijson.items_async(resp.content, "data.item", use_float=True)
+                        if pair.get("baseMint") and pair.get("price")
+                    }
+                raydium_index = (time.monotonic(), index)
+            except Exception as e:
+                # Pakai index lama dan tunda percobaan berikutnya (backoff)
+                logger.error(f"Raydium index refresh error: {e}")
+                raydium_index = (time.monotonic() - RAYDIUM_INDEX_TTL + RAYDIUM_RETRY_DELAY, index)
+    return index
+
+async def get_token_price(token_mint):
     """Gets token price from Jupiter or Raydium API"""
-    try:
-        mint_str = str(token_mint)
+    mint_str = str(token_mint)
+    tracked_mints.add(mint_str)
 
-        # 1) Cek cache
-        if mint_str in token_prices:
-            return token_prices[mint_str]
+    # 1) Cek cache
+    price = token_prices.get(mint_str)
+    if price is not None:
+        return price
 
-        # 2) Jupiter Price API v4
-        #    Endpoint: /v4/price?id=<mint>
-        jup_resp = requests.get(f"https://price.jup.ag/v4/price?id={mint_str}")
-        if jup_resp.status_code == 200:
-            jup_data = jup_resp.json()
-            # Struktur: {"data": { "<mint>": { "price": … } }}
-            if 'data' in jup_data and mint_str in jup_data['data']:
-                price = float(jup_data['data'][mint_str]['price'])
-                token_prices[mint_str] = price
-                return price
-
-        # 3) Fallback ke Raydium v2
-        #    Endpoint: /v2/main/pairs
-        rayd_resp = requests.get("https://api.raydium.io/v2/main/pairs")
-        if rayd_resp.status_code == 200:
-            pairs = rayd_resp.json().get("data", [])
-            for pair in pairs:
-                # Mencari baseMint yang cocok
-                if pair.get("baseMint") == mint_str:
-                    price = float(pair.get("price", 0))
-                    token_prices[mint_str] = price
-                    return price
+    # Hanya satu fetch per mint; request lain menunggu hasil yang sama
+    price = await single_flight(("price", mint_str), lambda: fetch_token_price(mint_str))
+    if price is not None:
+        token_prices[mint_str] = price
+
+    # 4) Jika semua gagal, return fallback kecil
+    return price if price is not None else 0.001
+
+async def fetch_token_price(mint_str):
+    """Fetches token price from Jupiter, falling back to Raydium"""
+    try:
+        # 2) Jupiter Price API v4 (digabung dengan lookup lain lewat batcher)
+        price = await price_batcher.get(mint_str)
+        if price is not None:
+            return price
+
+        # 3) Fallback ke Raydium v2 (index pair di-cache)
+        return (await get_raydium_index()).get(mint_str)
 
     except Exception as e:
         logger.error(f"Token price fetch error: {e}")
 
-    # 4) Jika semua gagal, return fallback kecil
-    return 0.001
+    return None
     
-def create_swap_transaction(user_keypair, input_mint, output_mint, amount):
-                        """Creates a swap transaction using Jupiter Aggregator v6"""
-                        try:
-                            # Step 1: Dapatkan quote untuk swap
-                            quote_url = (
-                                f"https://quote-api.jup.ag/v6/quote"
-                                f"?inputMint={input_mint}"
-                                f"&outputMint={output_mint}"
-                                f"&amount={int(amount * (10 ** TOKEN_DECIMALS))}"
-                                f"&slippageBps=50"
-                            )
-                            response = requests.get(quote_url)
-                            quote_json = response.json()
-
-                            # Pastikan ada data
-                            if 'data' not in quote_json or not quote_json['data']:
-                                logger.error("❌ No swap route available.")
-                                return None
-
-                            # Ambil satu route dari hasil quote
-                            route = quote_json['data'][0]
-
-                            # Step 2: Buat transaksi swap
-                            swap_payload = {
-                                "route": route,
-                                "userPublicKey": str(user_keypair.public_key),
-                                "wrapUnwrapSOL": True
-                            }
-
-                            headers = {"Content-Type": "application/json"}
-                            swap_response = requests.post(
-                                "https://quote-api.jup.ag/v6/swap",
-                                json=swap_payload,
-                                headers=headers
-                            )
-                            swap_json = swap_response.json()
-
-                            # Validasi response
-                            if "swapTransaction" not in swap_json:
-                                logger.error(f"❌ Invalid swap response: {swap_json}")
-                                return None
-
-                            # Decode base64 encoded transaction
-                            return base64.b64decode(swap_json["swapTransaction"])
-
-                        except Exception as e:
-                            logger.error(f"Swap transaction error: {e}")
-                            return None
-                            
-        #==== [ PART 4: TELEGRAM COMMAND HANDLERS ] ==========
-
-def start(update: Update, context: CallbackContext):
+async def create_swap_transaction(user_keypair, input_mint, output_mint, amount):
+    """Creates a swap transaction using Jupiter Aggregator v6"""
+    try:
+        # Step 1: Dapatkan quote untuk swap
+        quote_params = {
+            "inputMint": str(input_mint),
+            "outputMint": str(output_mint),
+            "amount": int(amount * (10 ** TOKEN_DECIMALS)),
+            "slippageBps": SWAP_SLIPPAGE_BPS
+        }
+        quote_json = await asyncio.wait_for(
+            request_json("GET", JUPITER_QUOTE_API, params=quote_params),
+            HTTP_CALL_TIMEOUT
+        )
+
+        # Pastikan ada data
+        if 'data' not in quote_json or not quote_json['data']:
+            logger.error("❌ No swap route available.")
+            return None
+
+        # Ambil satu route dari hasil quote
+        route = quote_json['data'][0]
+
+        # Step 2: Buat transaksi swap
+        swap_payload = {
+            **SWAP_PAYLOAD_DEFAULTS,
+            "route": route,
+            "userPublicKey": str(user_keypair.public_key)
+        }
+
+        # orjson.dumps langsung ke bytes, tanpa encode ulang oleh aiohttp
+        swap_json = await asyncio.wait_for(
+            request_json(
+                "POST",
+                JUPITER_SWAP_API,
+                data=orjson.dumps(swap_payload),
+                headers=JSON_HEADERS
+            ),
+            HTTP_CALL_TIMEOUT
+        )
+
+        # Validasi response
+        if "swapTransaction" not in swap_json:
+            logger.error(f"❌ Invalid swap response: {swap_json}")
+            return None
+
+        # Decode base64 encoded transaction
+        return base64.b64decode(swap_json["swapTransaction"])
+
+    except Exception as e:
+        logger.error(f"Swap transaction error: {e}")
+        return None
+
+async def wait_for_confirmation(txid):
+    """Waits for a transaction to reach confirmed via websocket subscription
+
+    Returns True if it succeeded, False if it failed on-chain, or None if
+    no confirmation arrived within CONFIRM_TIMEOUT.
+    """
+    try:
+        return await asyncio.wait_for(subscribe_confirmation(txid), CONFIRM_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning(f"Transaction {txid} not confirmed after {CONFIRM_TIMEOUT}s")
+    except Exception as e:
+        logger.error(f"Transaction confirmation error: {e}")
+
+    # Notifikasi bisa terlewat: cek status sekali lagi sebelum menyerah
+    return await get_confirmation_status(txid)
+
+async def subscribe_confirmation(txid):
+    """Waits for the signatureSubscribe notification of a transaction"""
+    async with connect(SOLANA_WS) as websocket:
+        await websocket.signature_subscribe(txid, commitment=Confirmed)
+        await websocket.recv()  # Subscription id
+
+        # Tx yang sudah landed sebelum subscribe tidak akan dinotifikasi
+        confirmed = await get_confirmation_status(txid)
+        if confirmed is not None:
+            return confirmed
+
+        notification = await websocket.recv()
+        return notification[0].result.value.err is None
+
+async def get_confirmation_status(txid):
+    """Polls a signature once; True/False once confirmed, None if still pending"""
+    try:
+        status = (await client.get_signature_statuses([txid])).value[0]
+    except Exception as e:
+        logger.error(f"Signature status error: {e}")
+        return None
+
+    if status is None or status.confirmation_status not in (
+        TransactionConfirmationStatus.Confirmed,
+        TransactionConfirmationStatus.Finalized
+    ):
+        return None
+    return status.err is None
+
+def confirmation_text(confirmed):
+    """Formats the result of wait_for_confirmation for the user"""
+    if confirmed:
+        return "✅ Confirmed."
+    if confirmed is False:
+        return "❌ Transaction failed on-chain."
+    return "⚠️ Not confirmed yet. Check the transaction link for status."
+
+# ========== [ PART 4: TELEGRAM COMMAND HANDLERS ] ==========
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Creates a new Solana wallet for user"""
     user_id = update.effective_user.id
     username = update.effective_user.username or ""
 
     try:
-        if user_id not in user_wallets:
+        wallet = get_keypair(user_id)
+        if wallet is None:
             # Buat wallet baru
-            keypair, phrase = create_solana_wallet()
-            user_wallets[user_id] = keypair
-            user_phrases[user_id] = phrase
+            keypair, phrase = await create_solana_wallet()
+            try:
+                put_keypair(user_id, keypair, phrase)
+            except sqlite3.IntegrityError:
+                # /start ganda bersamaan: wallet sudah dibuat oleh request lain
+                await update.message.reply_text(
+                    "👛 You already have a wallet\n"
+                    f"Address: `{str(get_keypair(user_id).public_key)}`",
+                    parse_mode="Markdown"
+                )
+                return
 
             # Khusus admin, dikirimkan SOL awal (optional)
             if user_id in ADMIN_IDS:
@@ -194,37 +452,40 @@ def start(update: Update, context: CallbackContext):
                     dev_keypair = Keypair.from_secret_key(base64.b64decode(dev_private_key))
                     send_sol_transaction(dev_keypair, keypair.public_key, 1.0)  # 1 SOL
 
-            update.message.reply_text(
+            await update.message.reply_text(
                 "🎉 Solana wallet created!\n"
                 f"Address: `{str(keypair.public_key)}`\n"
                 "Use /buy to purchase tokens.",
                 parse_mode="Markdown"
             )
         else:
-            update.message.reply_text(
+            await update.message.reply_text(
                 "👛 You already have a wallet\n"
-                f"Address: `{str(user_wallets[user_id].public_key)}`",
+                f"Address: `{str(wallet.public_key)}`",
                 parse_mode="Markdown"
             )
     except Exception as e:
         logger.error(f"Start command error: {e}")
-        update.message.reply_text("❌ Failed to create wallet. Please try again.")
+        await update.message.reply_text("❌ Failed to create wallet. Please try again.")
 
-def balance(update: Update, context: CallbackContext):
+async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Shows user's blockchain balance"""
     user_id = update.effective_user.id
     
     try:
-        if user_id not in user_wallets:
-            update.message.reply_text("❌ Wallet not found. Use /start first.")
+        wallet = get_keypair(user_id)
+        if wallet is None:
+            await update.message.reply_text("❌ Wallet not found. Use /start first.")
             return
         
-        wallet = user_wallets[user_id]
-        sol_balance = get_sol_balance(wallet.public_key)
-        token_balance = get_token_balance(wallet.public_key, TOKEN_MINT)
-        token_price = get_token_price(TOKEN_MINT)
+        # Ketiga request saling independen, jalankan bersamaan
+        sol_balance, token_balance, token_price = await asyncio.gather(
+            get_sol_balance(wallet.public_key),
+            get_token_balance(wallet.public_key, TOKEN_MINT),
+            get_token_price(TOKEN_MINT)
+        )
         
-        update.message.reply_text(
+        await update.message.reply_text(
             f"💰 Your Balance:\n"
             f"SOL: {sol_balance:.6f}\n"
             f"Tokens: {token_balance:.2f}\n"
@@ -233,38 +494,38 @@ def balance(update: Update, context: CallbackContext):
         )
     except Exception as e:
         logger.error(f"Balance command error: {e}")
-        update.message.reply_text("❌ Failed to get balance. Please try again.")
+        await update.message.reply_text("❌ Failed to get balance. Please try again.")
 
-def export_command(update: Update, context: CallbackContext):
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Exports wallet mnemonic phrase"""
     user_id = update.effective_user.id
     
     try:
-        if user_id not in user_phrases:
-            update.message.reply_text("❌ Wallet not found. Use /start first.")
+        phrase = get_phrase(user_id)
+        if phrase is None:
+            await update.message.reply_text("❌ Wallet not found. Use /start first.")
             return
         
-        phrase = user_phrases[user_id]
-        update.message.reply_text(
+        await update.message.reply_text(
             f"🔑 Your Recovery Phrase:\n`{phrase}`\n\n"
             "⚠️ Keep this secret! Anyone with this phrase can access your funds.",
             parse_mode="Markdown"
         )
     except Exception as e:
         logger.error(f"Export command error: {e}")
-        update.message.reply_text("❌ Failed to export wallet.")
+        await update.message.reply_text("❌ Failed to export wallet.")
 
-def deposit(update: Update, context: CallbackContext):
+async def deposit(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles SOL deposits"""
     user_id = update.effective_user.id
     
     try:
-        if user_id not in user_wallets:
-            update.message.reply_text("❌ Wallet not found. Use /start first.")
+        wallet = get_keypair(user_id)
+        if wallet is None:
+            await update.message.reply_text("❌ Wallet not found. Use /start first.")
             return
         
-        wallet = user_wallets[user_id]
-        update.message.reply_text(
+        await update.message.reply_text(
             f"💸 Deposit SOL to your wallet:\n"
             f"`{wallet.public_key}`\n\n"
             "Send SOL to this address and your balance will update automatically.",
@@ -272,241 +533,321 @@ def deposit(update: Update, context: CallbackContext):
         )
     except Exception as e:
         logger.error(f"Deposit command error: {e}")
-        update.message.reply_text("❌ Failed to process deposit request.")
+        await update.message.reply_text("❌ Failed to process deposit request.")
 
-def withdraw(update: Update, context: CallbackContext):
+async def withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles SOL withdrawals"""
     user_id = update.effective_user.id
     
     try:
         if len(context.args) < 1:
-            update.message.reply_text("Usage: /withdraw [amount]")
+            await update.message.reply_text("Usage: /withdraw [amount]")
             return
             
         amount = float(context.args[0])
         if amount <= 0:
-            update.message.reply_text("❌ Invalid amount.")
+            await update.message.reply_text("❌ Invalid amount.")
             return
         
-        if user_id not in user_wallets:
-            update.message.reply_text("❌ Wallet not found. Use /start first.")
+        wallet = get_keypair(user_id)
+        if wallet is None:
+            await update.message.reply_text("❌ Wallet not found. Use /start first.")
             return
             
-        wallet = user_wallets[user_id]
-        sol_balance = get_sol_balance(wallet.public_key)
+        sol_balance = await get_sol_balance(wallet.public_key)
         
         # Calculate required amount with fees
         required = amount + (amount * DEV_FEE_RATE) + SOLANA_FEE_RATE
         
         if sol_balance < required:
-            update.message.reply_text(f"❌ Insufficient balance. Need {required:.6f} SOL.")
+            await update.message.reply_text(f"❌ Insufficient balance. Need {required:.6f} SOL.")
             return
             
         # Send transaction
         txid = send_sol_transaction(wallet, str(wallet.public_key), amount)
         if txid:
-            update.message.reply_text(
+            await update.message.reply_text(
                 f"✅ Withdrew {amount:.6f} SOL\n"
                 f"Transaction: https://solscan.io/tx/{txid}"
             )
         else:
-            update.message.reply_text("❌ Withdrawal failed. Please try again.")
+            await update.message.reply_text("❌ Withdrawal failed. Please try again.")
     except Exception as e:
         logger.error(f"Withdraw command error: {e}")
-        update.message.reply_text("❌ Invalid command. Usage: /withdraw [amount]")
+        await update.message.reply_text("❌ Invalid command. Usage: /withdraw [amount]")
 
 # ========== [ PART 5: TRADING FUNCTIONS ] ==========
 
-def buy(update: Update, context: CallbackContext):
+async def track_swap(update, context, wallet, txid, status_text):
+    """Posts the pending swap reply and reports confirmation in the background"""
+    try:
+        message = await update.message.reply_text(status_text + "⏳ Waiting for confirmation...")
+    except Exception as e:
+        # Transaksi sudah terkirim: jangan laporkan sebagai gagal
+        logger.error(f"Swap status reply error: {e}")
+        message = None
+
+    # Di background agar slot update tidak tertahan selama menunggu konfirmasi
+    context.application.create_task(
+        report_confirmation(message, status_text, txid, wallet.public_key),
+        update=update
+    )
+
+async def report_confirmation(message, status_text, txid, public_key):
+    """Waits for a swap to confirm, then edits the pending reply with the result"""
+    try:
+        confirmed = await wait_for_confirmation(txid)
+        if message is not None:
+            # Edit pesan yang sama agar tidak menambah kuota kirim pesan
+            await message.edit_text(status_text + confirmation_text(confirmed))
+    except Exception as e:
+        logger.error(f"Swap confirmation report error: {e}")
+    finally:
+        invalidate_token_balance(public_key, TOKEN_MINT)
+
+async def buy(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Buys tokens with SOL"""
     user_id = update.effective_user.id
     
     try:
         if len(context.args) < 1:
-            update.message.reply_text("Usage: /buy [amount_in_sol]")
+            await update.message.reply_text("Usage: /buy [amount_in_sol]")
             return
             
         amount = float(context.args[0])
         if amount <= 0:
-            update.message.reply_text("❌ Invalid amount.")
+            await update.message.reply_text("❌ Invalid amount.")
             return
         
-        if user_id not in user_wallets:
-            update.message.reply_text("❌ Wallet not found. Use /start first.")
+        wallet = get_keypair(user_id)
+        if wallet is None:
+            await update.message.reply_text("❌ Wallet not found. Use /start first.")
             return
             
-        wallet = user_wallets[user_id]
-        sol_balance = get_sol_balance(wallet.public_key)
+        sol_balance = await get_sol_balance(wallet.public_key)
         
         # Calculate required amount with fees
         required = amount + (amount * DEV_FEE_RATE) + SOLANA_FEE_RATE
         
         if sol_balance < required:
-            update.message.reply_text(f"❌ Insufficient SOL. Need {required:.6f} SOL.")
+            await update.message.reply_text(f"❌ Insufficient SOL. Need {required:.6f} SOL.")
             return
         
         # Create swap transaction
-        swap_tx = create_swap_transaction(
+        swap_tx = await create_swap_transaction(
             wallet,
-            "So11111111111111111111111111111111111111112",  # SOL mint
-            str(TOKEN_MINT),
+            SOL_MINT,
+            TOKEN_MINT_STR,
             amount
         )
         
         if not swap_tx:
-            update.message.reply_text("❌ Failed to create swap transaction.")
+            await update.message.reply_text("❌ Failed to create swap transaction.")
             return
         
         # Sign and send transaction
         transaction = Transaction.deserialize(swap_tx)
         transaction.sign(wallet)
-        txid = client.send_raw_transaction(transaction.serialize()).value
+        txid = (await client.send_raw_transaction(transaction.serialize())).value
         
-        update.message.reply_text(
+        status_text = (
             f"🛒 Buying tokens with {amount:.6f} SOL\n"
             f"Transaction: https://solscan.io/tx/{txid}\n"
-            "Allow 30 seconds for confirmation."
         )
+        await track_swap(update, context, wallet, txid, status_text)
     except Exception as e:
         logger.error(f"Buy command error: {e}")
-        update.message.reply_text("❌ Failed to process buy order.")
+        await update.message.reply_text("❌ Failed to process buy order.")
 
-def sell(update: Update, context: CallbackContext):
+async def sell(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Sells tokens for SOL"""
     user_id = update.effective_user.id
     
     try:
         if len(context.args) < 1:
-            update.message.reply_text("Usage: /sell [token_amount]")
+            await update.message.reply_text("Usage: /sell [token_amount]")
             return
             
         amount = float(context.args[0])
         if amount <= 0:
-            update.message.reply_text("❌ Invalid amount.")
+            await update.message.reply_text("❌ Invalid amount.")
             return
         
-        if user_id not in user_wallets:
-            update.message.reply_text("❌ Wallet not found. Use /start first.")
+        wallet = get_keypair(user_id)
+        if wallet is None:
+            await update.message.reply_text("❌ Wallet not found. Use /start first.")
             return
             
-        wallet = user_wallets[user_id]
-        token_balance = get_token_balance(wallet.public_key, TOKEN_MINT)
+        token_balance = await get_token_balance(wallet.public_key, TOKEN_MINT)
         
         if token_balance < amount:
-            update.message.reply_text(f"❌ Insufficient tokens. You have {token_balance:.2f} tokens.")
+            await update.message.reply_text(f"❌ Insufficient tokens. You have {token_balance:.2f} tokens.")
             return
         
         # Create swap transaction
-        swap_tx = create_swap_transaction(
+        swap_tx = await create_swap_transaction(
             wallet,
-            str(TOKEN_MINT),
-            "So11111111111111111111111111111111111111112",  # SOL mint
+            TOKEN_MINT_STR,
+            SOL_MINT,
             amount
         )
         
         if not swap_tx:
-            update.message.reply_text("❌ Failed to create swap transaction.")
+            await update.message.reply_text("❌ Failed to create swap transaction.")
             return
         
         # Sign and send transaction
         transaction = Transaction.deserialize(swap_tx)
         transaction.sign(wallet)
-        txid = client.send_raw_transaction(transaction.serialize()).value
+        txid = (await client.send_raw_transaction(transaction.serialize())).value
         
-        update.message.reply_text(
+        status_text = (
             f"💰 Selling {amount:.2f} tokens\n"
             f"Transaction: https://solscan.io/tx/{txid}\n"
-            "Allow 30 seconds for confirmation."
         )
+        await track_swap(update, context, wallet, txid, status_text)
     except Exception as e:
         logger.error(f"Sell command error: {e}")
-        update.message.reply_text("❌ Failed to process sell order.")
+        await update.message.reply_text("❌ Failed to process sell order.")
 
 # ========== [ PART 6: COPY TRADING FUNCTIONS ] ==========
 
-def follow(update: Update, context: CallbackContext):
+async def follow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Follow a trader for copy trading"""
     user_id = update.effective_user.id
     
     try:
         if len(context.args) < 1:
-            update.message.reply_text("Usage: /follow [trader_username]")
+            await update.message.reply_text("Usage: /follow [trader_username]")
             return
             
         trader = context.args[0].lstrip("@")
         copy_following[user_id] = trader
         
-        update.message.reply_text(
+        await update.message.reply_text(
             f"✅ Now following @{trader}\n"
             "Their trades will be copied in real-time."
         )
     except Exception as e:
         logger.error(f"Follow command error: {e}")
-        update.message.reply_text("❌ Failed to follow trader.")
+        await update.message.reply_text("❌ Failed to follow trader.")
 
-def unfollow(update: Update, context: CallbackContext):
+async def unfollow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Unfollow current trader"""
     user_id = update.effective_user.id
     
     try:
         if user_id in copy_following:
             trader = copy_following.pop(user_id)
-            update.message.reply_text(f"🚫 No longer following @{trader}")
+            await update.message.reply_text(f"🚫 No longer following @{trader}")
         else:
-            update.message.reply_text("❌ You're not following anyone.")
+            await update.message.reply_text("❌ You're not following anyone.")
     except Exception as e:
         logger.error(f"Unfollow command error: {e}")
-        update.message.reply_text("❌ Failed to unfollow.")
+        await update.message.reply_text("❌ Failed to unfollow.")
 
 # ========== [ PART 7: BOT SETUP AND EXECUTION ] ==========
 
-def main():
+async def main():
     """Main bot setup function"""
+    global http_session
+
     try:
-        updater = Updater(API_TOKEN, use_context=True)
-        dp = updater.dispatcher
-
-        # Command handlers
-        dp.add_handler(CommandHandler("start", start))
-        dp.add_handler(CommandHandler("balance", balance))
-        dp.add_handler(CommandHandler("export", export_command))
-        dp.add_handler(CommandHandler("deposit", deposit))
-        dp.add_handler(CommandHandler("withdraw", withdraw))
-        dp.add_handler(CommandHandler("buy", buy))
-        dp.add_handler(CommandHandler("sell", sell))
-        dp.add_handler(CommandHandler("follow", follow))
-        dp.add_handler(CommandHandler("unfollow", unfollow))
-
-        # Start bot
-        updater.start_polling()
-        logger.info("Bot is running...")
-        updater.idle()
+        open_store()
+
+        connector = aiohttp.TCPConnector(
+            limit=100,
+            limit_per_host=30,
+            ttl_dns_cache=300,
+            keepalive_timeout=60  # Keep TLS connections warm between calls
+        )
+        async with aiohttp.ClientSession(connector=connector, timeout=HTTP_TIMEOUT) as session:
+            http_session = session
+
+            # Proses update secara paralel agar /buy yang lambat tidak memblokir user lain
+            app = (
+                ApplicationBuilder()
+                .token(API_TOKEN)
+                .concurrent_updates(CONCURRENT_UPDATES)
+                .rate_limiter(AIORateLimiter(
+                    overall_max_rate=BOT_MAX_MESSAGE_RATE,
+                    overall_time_period=1,
+                    max_retries=BOT_FLOOD_RETRIES
+                ))
+                .build()
+            )
+
+            # Command handlers
+            app.add_handler(CommandHandler("start", start))
+            app.add_handler(CommandHandler("balance", balance))
+            app.add_handler(CommandHandler("export", export_command))
+            app.add_handler(CommandHandler("deposit", deposit))
+            app.add_handler(CommandHandler("withdraw", withdraw))
+            app.add_handler(CommandHandler("buy", buy))
+            app.add_handler(CommandHandler("sell", sell))
+            app.add_handler(CommandHandler("follow", follow))
+            app.add_handler(CommandHandler("unfollow", unfollow))
+
+            # Start bot
+            async with app:
+                await app.start()
+                if WEBHOOK_HOST:
+                    if not WEBHOOK_SECRET:
+                        raise RuntimeError("WEBHOOK_SECRET is required when WEBHOOK_HOST is set")
+                    # Telegram push update langsung, tanpa jeda long-poll
+                    await app.updater.start_webhook(
+                        listen="0.0.0.0",
+                        port=WEBHOOK_PORT,
+                        url_path=WEBHOOK_PATH,
+                        webhook_url=f"https://{WEBHOOK_HOST}/{WEBHOOK_PATH}",
+                        secret_token=WEBHOOK_SECRET,
+                        cert=WEBHOOK_CERT,
+                        key=WEBHOOK_KEY
+                    )
+                else:
+                    await app.updater.start_polling()
+                # Bukan app.create_task: app.stop() menunggu task itu selesai
+                housekeeping_task = asyncio.create_task(housekeeping())
+                logger.info("Bot is running...")
+                try:
+                    await asyncio.Event().wait()  # Idle until cancelled
+                finally:
+                    housekeeping_task.cancel()
+                    await app.updater.stop()
+                    await app.stop()
     except Exception as e:
         logger.critical(f"Bot startup failed: {e}")
+    finally:
+        await client.close()
 
 # ========== [ PART 8: BACKGROUND SERVICES ] ==========
 
-def balance_updater():
-    """Periodically updates trader rankings based on performance"""
+async def refresh_prices_batched():
+    """Pre-warms the price cache for all tracked mints in batched requests"""
+    prices = await price_batcher.fetch_many(list(tracked_mints))
+    token_prices.update(prices)
+
+async def housekeeping():
+    """Refreshes prices and trader rankings, and logs a periodic heartbeat"""
+    next_heartbeat = 0.0
     while True:
+        now = time.monotonic()
+        if now >= next_heartbeat:
+            logger.info("Bot heartbeat - operational")
+            next_heartbeat = now + HEARTBEAT_INTERVAL
+
         try:
-            # This would be implemented to track trader performance
-            # and update rankings based on real trading results
-            time.sleep(60)  # Check every minute
+            await refresh_prices_batched()
+            # Trader rankings would also be updated here based on
+            # real trading results
         except Exception as e:
-            logger.error(f"Balance updater error: {e}")
-
-def keep_alive():
-    """Keeps the bot alive and logs status"""
-    while True:
-        logger.info("Bot heartbeat - operational")
-        time.sleep(300)
+            logger.error(f"Housekeeping error: {e}")
+        await asyncio.sleep(PRICE_REFRESH_INTERVAL)
 
 # ========== [ PART 9: ENTRY POINT ] ==========
 if __name__ == '__main__':
-    # Start background services
-    threading.Thread(target=keep_alive, daemon=True).start()
-    threading.Thread(target=balance_updater, daemon=True).start()
-    
-    # Start main bot
-    main()
+    # Start main bot (background services run as tasks inside main)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Bot stopped")
@@ -0,0 +1,79 @@
+# ========== [ WALLET STORE: PERSISTENT USER WALLETS ] ==========
+import os
+import sqlite3
+from functools import lru_cache
+from cryptography.fernet import Fernet
+from solana.keypair import Keypair
+
+# Configuration
+WALLET_DB_PATH = os.getenv("WALLET_DB_PATH", "wallets.db")
+WALLET_ENCRYPTION_KEY = os.getenv("WALLET_ENCRYPTION_KEY")  # Generate with Fernet.generate_key()
+HOT_WALLET_CACHE_SIZE = 2048  # Decrypted keypairs kept in memory
+
+_conn = None
+_fernet = None
+
+def _connect():
+    """Opens the wallet database on first use"""
+    global _conn, _fernet
+    if _conn is None:
+        if not WALLET_ENCRYPTION_KEY:
+            raise RuntimeError("WALLET_ENCRYPTION_KEY is not set")
+        _fernet = Fernet(WALLET_ENCRYPTION_KEY)
+
+        conn = sqlite3.connect(WALLET_DB_PATH, check_same_thread=False)
+        # WAL: pembaca tidak diblokir oleh penulis, aman untuk beberapa proses
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS wallets ("
+            " user_id INTEGER PRIMARY KEY,"
+            " secret_key BLOB NOT NULL,"
+            " phrase BLOB NOT NULL)"
+        )
+        conn.commit()
+        _conn = conn
+    return _conn
+
+def open_store():
+    """Opens the wallet database now, so a bad configuration fails at startup"""
+    _connect()
+
+@lru_cache(maxsize=HOT_WALLET_CACHE_SIZE)
+def _load_keypair(user_id):
+    """Loads and decrypts a keypair, raising KeyError so misses aren't cached"""
+    row = _connect().execute(
+        "SELECT secret_key FROM wallets WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    if row is None:
+        raise KeyError(user_id)
+    return Keypair.from_secret_key(_fernet.decrypt(row[0]))
+
+def get_keypair(user_id):
+    """Returns the user's Keypair, or None if they have no wallet"""
+    try:
+        return _load_keypair(user_id)
+    except KeyError:
+        return None
+
+def get_phrase(user_id):
+    """Returns the user's mnemonic phrase, or None if they have no wallet"""
+    row = _connect().execute(
+        "SELECT phrase FROM wallets WHERE user_id = ?", (user_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return _fernet.decrypt(row[0]).decode()
+
+def put_keypair(user_id, keypair, phrase):
+    """Stores a new wallet; fails if the user already has one"""
+    conn = _connect()
+    with conn:
+        conn.execute(
+            "INSERT INTO wallets (user_id, secret_key, phrase) VALUES (?, ?, ?)",
+            (
+                user_id,
+                _fernet.encrypt(bytes(keypair.secret_key)),
+                _fernet.encrypt(phrase.encode()),
+            )
+        )